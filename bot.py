@@ -16,6 +16,7 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import contextlib
+import functools
 import logging
 from pathlib import Path
 
@@ -45,6 +46,18 @@ class HelpCommand(commands.MinimalHelpCommand):
 
 		await self.send_cog_help(cog)
 
+class Queries:
+	"""wraps a template module so that each query macro is only rendered once per set of arguments"""
+
+	def __init__(self, module):
+		self.module = module
+
+	def __getattr__(self, name):
+		macro = functools.cache(getattr(self.module, name))
+		# only looked up once, as the next lookup will find the instance attribute instead
+		setattr(self, name, macro)
+		return macro
+
 class HighlightBot(Bot):
 	def __init__(self, *, config):
 		self.jinja_env = jinja2.Environment(
@@ -65,10 +78,11 @@ class HighlightBot(Bot):
 		super().process_config()
 		success_emojis = self.config.get('success_or_failure_emojis')
 		if success_emojis:
-			utils.SUCCESS_EMOJIS = success_emojis
+			# the documented False and True keys are unquoted identifiers, which json5 reads as strings
+			utils.SUCCESS_EMOJIS = (success_emojis['False'], success_emojis['True'])
 
 	def queries(self, template_name):
-		return self.jinja_env.get_template(template_name).module
+		return Queries(self.jinja_env.get_template(template_name).module)
 
 	startup_extensions = (
 		'cogs.highlight',
@@ -42,6 +42,13 @@ class InvalidHighlightLength(HighlightError):
 	pass
 
 HighlightUser = namedtuple('HighlightUser', 'id preferred_caps')
+# regexes: frozenset of lowercase highlights -> regex matching them, shared by channels that look for the same ones
+# channels: channel ID -> (lowercase highlight -> [HighlightUser], regex)
+GuildHighlights = namedtuple('GuildHighlights', 'regexes channels')
+
+class Pending:
+	"""placeholder for a cache entry whose value is being fetched. invalidating the entry removes it"""
+	__slots__ = ()
 
 class DatabaseInterface:
 	def __init__(self, bot):
@@ -49,12 +56,30 @@ class DatabaseInterface:
 		self.pool = bot.pool
 		self.queries = bot.queries('highlight.sql')
 		self.highlight_cache = utils.LRUDict(size=1_000)
+		# (guild ID, user ID) -> highlights, for the list command
+		self.user_highlights_cache = utils.LRUDict(size=1_000)
+		# user ID -> blocks, for the blocked command
+		self.blocks_cache = utils.LRUDict(size=1_000)
+		# IDs of guilds that may have highlights. this may contain guilds whose highlights have all been removed,
+		# but never omits a guild that has any
+		self.highlighted_guilds = set()
 
 	### Queries
 
+	async def load_highlighted_guilds(self):
+		self.highlighted_guilds = {row['guild'] for row in await self.pool.fetch(self.queries.highlighted_guilds())}
+
+	def guild_has_highlights(self, guild_id):
+		return guild_id in self.highlighted_guilds
+
 	async def channel_highlights(self, channel):
-		if channel.id in self.highlight_cache.get(channel.guild.id, {}):
-			return self.highlight_cache[channel.guild.id][channel.id]
+		try:
+			guild_highlights = self.highlight_cache[channel.guild.id]
+		except KeyError:
+			self.highlight_cache[channel.guild.id] = guild_highlights = GuildHighlights(regexes={}, channels={})
+		else:
+			if channel.id in guild_highlights.channels:
+				return guild_highlights.channels[channel.id]
 
 		highlight_users: DefaultDict[str, List[HighlightUser]] = defaultdict(list)
 		async for user_id, highlight in self.cursor(
@@ -65,32 +90,88 @@ class DatabaseInterface:
 			# so that the original case can eventually be displayed to the user
 			highlight_users[highlight.lower()].append(HighlightUser(id=user_id, preferred_caps=highlight))
 
-		for other_highlight_users, regex in self.highlight_cache.get(channel.guild.id, {}).values():
+		for other_highlight_users, regex in guild_highlights.channels.values():
 			if highlight_users == other_highlight_users:
-				self.highlight_cache.setdefault(channel.guild.id, {})[channel.id] = ret = (other_highlight_users, regex)
+				guild_highlights.channels[channel.id] = ret = (other_highlight_users, regex)
 				return ret
 
-		self.highlight_cache.setdefault(channel.guild.id, {})[channel.id] = ret = (
-			highlight_users,
-			self._build_re(set(highlight_users.keys())),
-		)
+		# each channel's regex only matches the highlights that have users there, since the longest match wins
+		# and a highlight without users would hide a shorter one that has some
+		highlights = frozenset(highlight_users)
+		try:
+			regex = guild_highlights.regexes[highlights]
+		except KeyError:
+			guild_highlights.regexes[highlights] = regex = self._build_re(highlights)
+
+		guild_highlights.channels[channel.id] = ret = (highlight_users, regex)
 		return ret
 
-	@staticmethod
-	def _build_re(highlights):
+	@classmethod
+	def _build_re(cls, highlights):
+		"""build a regex matching any of highlights, which must be lowercase, in lowercased text"""
+		# factor the highlights into a trie so that at each position the regex engine
+		# compares each character once, rather than retrying every highlight in turn
+		trie = {}
+		for highlight in highlights:
+			node = trie
+			for char in highlight:
+				node = node.setdefault(char, {})
+			# marks the end of a highlight
+			node[''] = {}
+
 		return re.compile((
-			r'(?i)'  # case insensitive
 			r'\b'  # word bound
-			r'(?:{})'  # non capturing group, to make sure that the word bound occurs before/after all words
+			r'{}'
 			r'\b'
-		).format('|'.join(map(re.escape, highlights))))
+		).format(cls._trie_re(trie)))
+
+	@classmethod
+	def _trie_re(cls, node):
+		branches = [re.escape(char) + cls._trie_re(child) for char, child in node.items() if char]
+		if not branches:
+			return ''
+		if len(branches) == 1 and '' not in node:
+			# a single highlight, or a prefix shared by several, needs no alternation
+			return branches[0]
+
+		# non capturing group, to make sure that the word bound occurs before/after all words
+		group = '(?:{})'.format('|'.join(branches))
+		# a highlight may end here, but if a longer one matches, prefer it
+		return group + '?' if '' in node else group
 
 	async def user_highlights(self, guild, user):
+		key = guild, user
+		try:
+			highlights = self.user_highlights_cache[key]
+		except KeyError:
+			pass
+		else:
+			if not isinstance(highlights, Pending):
+				return highlights
+
+		# a write that commits during the fetch removes the placeholder, so the possibly stale result is not cached
+		self.user_highlights_cache[key] = pending = Pending()
 		# tfw no "fetchvals"
-		return [row['highlight'] for row in await self.pool.fetch(self.queries.user_highlights(), guild, user)]
+		highlights = [row['highlight'] for row in await self.pool.fetch(self.queries.user_highlights(), guild, user)]
+		if self.user_highlights_cache.get(key) is pending:
+			self.user_highlights_cache[key] = highlights
+		return highlights
 
 	async def blocks(self, user):
-		return {(row['entity'], S(row['type'])) for row in await self.pool.fetch(self.queries.blocks(), user)}
+		try:
+			blocks = self.blocks_cache[user]
+		except KeyError:
+			pass
+		else:
+			if not isinstance(blocks, Pending):
+				return blocks
+
+		# see user_highlights
+		self.blocks_cache[user] = pending = Pending()
+		blocks = {(row['entity'], S(row['type'])) for row in await self.pool.fetch(self.queries.blocks(), user)}
+		if self.blocks_cache.get(user) is pending:
+			self.blocks_cache[user] = blocks
+		return blocks
 
 	async def blocked(self, user, entity):
 		"""Return whether user has blocked entity"""
@@ -103,6 +184,8 @@ class DatabaseInterface:
 		async with self.pool.acquire() as conn, conn.transaction():
 			await self._add_highlight_check(guild, user, highlight, connection=conn)
 			await conn.execute(self.queries.add(), guild, user, highlight)
+		self.highlighted_guilds.add(guild)
+		self._remove_user_highlights_from_cache(guild, user)
 
 	async def _add_highlight_check(self, guild, user, highlight, *, connection):
 		if len(highlight) < MIN_HIGHLIGHT_LENGTH:
@@ -119,20 +202,27 @@ class DatabaseInterface:
 	async def remove(self, guild, user, highlight):
 		self._remove_from_cache(guild)
 		await self.pool.execute(self.queries.remove(), guild, user, highlight)
+		self._remove_user_highlights_from_cache(guild, user)
 
 	async def clear(self, guild, user):
 		self._remove_from_cache(guild)
 		await self.pool.execute(self.queries.clear(), guild, user)
+		self._remove_user_highlights_from_cache(guild, user)
 
 	async def clear_guild(self, guild):
 		self._remove_from_cache(guild)
 		await self.pool.execute(self.queries.clear_guild(), guild)
+		self.highlighted_guilds.discard(guild)
+		for key in [key for key in self.user_highlights_cache if key[0] == guild]:
+			del self.user_highlights_cache[key]
 
 	async def import_(self, source_guild, target_guild, user):
 		self._remove_from_cache(target_guild)
 		async with self.pool.acquire() as conn, conn.transaction():
 			await self._import_highlights_check(source_guild, target_guild, user, connection=conn)
 			await conn.execute(self.queries.import_(), source_guild, target_guild, user)
+		self.highlighted_guilds.add(target_guild)
+		self._remove_user_highlights_from_cache(target_guild, user)
 
 	async def _import_highlights_check(self, source_guild, target_guild, user, *, connection):
 		source_guild_count = await self.highlight_count(source_guild, user, connection=connection)
@@ -157,10 +247,12 @@ class DatabaseInterface:
 	async def block(self, guild, user, entity_id: int, entity_type: S):
 		self._remove_from_cache(guild, entity_id)
 		await self.pool.execute(self.queries.block(), user, entity_id, entity_type.name)
+		self.blocks_cache.pop(user, None)
 
 	async def unblock(self, guild, user, entity_id: int):
 		self._remove_from_cache(guild, entity_id)
 		await self.pool.execute(self.queries.unblock(), user, entity_id)
+		self.blocks_cache.pop(user, None)
 
 	async def delete_account(self, user_id):
 		if self.bot.get_user(user_id):
@@ -172,13 +264,22 @@ class DatabaseInterface:
 			for table in 'highlights', 'blocks':
 				await conn.execute(self.queries.delete_by_user(table), user_id)
 
+		for key in [key for key in self.user_highlights_cache if key[1] == user_id]:
+			del self.user_highlights_cache[key]
+		self.blocks_cache.pop(user_id, None)
+
 	def _remove_from_cache(self, guild_id, channel_id=None):
 		if channel_id is not None:
-			self.highlight_cache.get(guild_id, {}).pop(channel_id, None)
+			guild_highlights = self.highlight_cache.get(guild_id)
+			if guild_highlights is not None:
+				guild_highlights.channels.pop(channel_id, None)
 			return
 
 		self.highlight_cache.pop(guild_id, None)
 
+	def _remove_user_highlights_from_cache(self, guild_id, user_id):
+		self.user_highlights_cache.pop((guild_id, user_id), None)
+
 	async def cursor(self, query, *args):
 		async with self.pool.acquire() as connection, connection.transaction():
 			async for row in connection.cursor(query, *args):
@@ -15,8 +15,6 @@
 
 import asyncio
 import collections
-import copy
-import contextlib
 import functools
 import operator
 import re
@@ -57,6 +55,8 @@ NEW_MESSAGES_DELAY = 10
 DELETE_AFTER = 5
 # how many seconds to wait before deleting long messages, such as lists
 DELETE_LONG_AFTER = 15
+# how many seconds to skip notifying a user after we found that their DMs are closed
+DM_CLOSED_RETRY_AFTER = 60 * 60
 
 def guild_only_command(*args, **kwargs):
 	def wrapper(func):
@@ -68,16 +68,65 @@ MENTION_RE = re.compile(r'<@!?(\d+)>', re.ASCII)
 NICKNAME_MENTION_RE = re.compile(MENTION_RE.pattern.replace('!?', '!'), MENTION_RE.flags)
 
 def normalize_mentions(s):
+	if '<@!' not in s:
+		# most messages have no nickname mentions, and a substring search is much cheaper than a regex
+		return s
 	return NICKNAME_MENTION_RE.sub(r'<@\1>', s)
 
+def contains_mention(s):
+	# every mention contains '<@', and a substring search is much cheaper than a regex
+	return '<@' in s and MENTION_RE.search(s) is not None
+
+def is_mention_match(content, start, end):
+	"""return whether the match content[start:end] is part of an @mention, or contains one
+
+	content must have had its mentions normalized already.
+	"""
+	match = content[start:end]
+	if contains_mention(match):
+		return True
+	# peek around the matched string in order to distinguish textual numbers from @mentions
+	return (
+		start >= len('<@')
+		and content[start - 1] == '@'
+		and content[start - 2] == '<'
+		and content[end:end + 1] == '>'
+		and match.isascii()
+		and match.isdigit()
+	)
+
+def resolve_waiter(waiter, result):
+	# the waiter may have been cancelled or already resolved by the time this runs
+	if not waiter.done():
+		waiter.set_result(result)
+
+class MessageSnapshot(collections.namedtuple('MessageSnapshot', 'id content jump_url created_at author guild channel')):
+	"""the parts of a message that notifications read, frozen against later edits"""
+
+	__slots__ = ()
+
+	@classmethod
+	def from_message(cls, message):
+		return cls._make(getattr(message, field) for field in cls._fields)
+
 class Highlight(commands.Cog):
 	def __init__(self, bot):
 		self.bot = bot
 		self.db = DatabaseInterface(self.bot)
-		self.recently_active = utils.LRUDict(size=1_000)
+		self.recently_active = utils.TTLSet(ttl=INACTIVITY_CUTOFF)
+		# (channel ID, user ID) -> futures to resolve when that user is next active in that channel
+		self.activity_waiters = {}
+		# user ID -> time.monotonic() of the last DM that was refused
+		self.dm_closed = utils.LRUDict(size=10_000)
+		self.reaper = utils.Reaper()
 		self.setup_ctx_menu()
 
+	async def cog_load(self):
+		await self.db.load_highlighted_guilds()
+		self.reaper.start()
+
 	async def cog_unload(self):
+		await self.reaper.stop()
 		self.teardown_ctx_menu()
 
 	def setup_ctx_menu(self):
@@ -97,42 +146,76 @@ class Highlight(commands.Cog):
 		if not message.guild or not self.bot.should_reply(message):
 			return
 
-		self.bot.dispatch('user_activity', message.channel.id, message.author.id)
+		self.user_activity(message.channel.id, message.author.id)
+
+		if not self.db.guild_has_highlights(message.guild.id):
+			# most guilds have no highlights, so don't bother looking for any
+			return
 
-		# prevent message edits from updating this message obj
-		message = copy.copy(message)
-		coros = []
-		async for highlighted_user, highlight in self.HighlightFinder(bot=self.bot, message=message, db=self.db):
+		recipients = []
+		waits = []
+
+		def found(highlighted_user, highlight):
 			info = message.channel.id, highlighted_user.id
 			if not self.was_recently_active(info):
 				# add to the dict first to prevent other message events from notifying as well
 				# this is to prevent two messages sent in immediate succession
 				# from notifying the user twice
-				self.recently_active[info] = time.monotonic()
-
-				coros.append(self.notify_if_user_is_inactive(highlighted_user, highlight, message))
-
-		# notify everyone asynchronously
-		async with asyncio.TaskGroup() as tg:
-			for coro in coros:
-				tg.create_task(coro)
+				self.recently_active.add(info)
+				recipients.append((highlighted_user, highlight))
+				# wait for each user as soon as they are found, so that the wait overlaps with finding the rest
+				waits.append(asyncio.create_task(self.is_inactive(*info)))
 
-	@commands.Cog.listener()
-	async def on_user_activity(self, channel_id, user_id):
-		"""dispatched whenever a user does something that would cause them to see recent messages in channel_id"""
-		self.recently_active[channel_id, user_id] = time.monotonic()
+		try:
+			await self.HighlightFinder(bot=self.bot, message=message, db=self.db).find(found)
+			if not recipients:
+				return
 
-	async def notify_if_user_is_inactive(self, highlighted_user, highlight, message):
+			# prevent message edits from changing what the notifications show
+			message = MessageSnapshot.from_message(message)
+
+			inactive = await asyncio.gather(*waits)
+		finally:
+			for wait in waits:
+				wait.cancel()
+
+		recipients = [
+			(highlighted_user, highlight)
+			for (highlighted_user, highlight), is_inactive in zip(recipients, inactive)
+			# don't bother fetching the message history for DMs that will be refused anyway
+			if is_inactive and not self.dms_closed(highlighted_user)
+		]
+		if recipients:
+			await self.notify(recipients, message)
+
+	def user_activity(self, channel_id, user_id):
+		"""called whenever a user does something that would cause them to see recent messages in channel_id"""
+		# recorded directly rather than from a listener, which would cost a task per event
+		self.recently_active.add((channel_id, user_id))
+		for waiter in self.activity_waiters.pop((channel_id, user_id), ()):
+			resolve_waiter(waiter, False)
+		# lets other cogs listen for on_user_activity
+		self.bot.dispatch('user_activity', channel_id, user_id)
+
+	async def is_inactive(self, channel_id, user_id):
+		"""wait for new messages, and return whether the user did nothing in the channel meanwhile"""
+		# keyed waiters rather than bot.wait_for, whose check would run for every pending waiter on every event
+		info = channel_id, user_id
+		loop = asyncio.get_running_loop()
+		waiter = loop.create_future()
+		self.activity_waiters.setdefault(info, set()).add(waiter)
+		# a timer handle rather than asyncio.wait_for, which would wrap the waiter in a task of its own
+		# resolves to True if no activity is received in time, or False from user_activity
+		timer = loop.call_later(NEW_MESSAGES_DELAY, resolve_waiter, waiter, True)
 		try:
-			await self.bot.wait_for('user_activity',
-				check=lambda channel_id, user_id:
-					channel_id == message.channel.id
-					and user_id == highlighted_user.id,
-				timeout=NEW_MESSAGES_DELAY,
-			)
-		except asyncio.TimeoutError:
-			# no activity received in time
-			await self.notify(highlighted_user, highlight, message)
+			return await waiter
+		finally:
+			timer.cancel()
+			waiters = self.activity_waiters.get(info)
+			if waiters is not None:
+				waiters.discard(waiter)
+				if not waiters:
+					del self.activity_waiters[info]
 
 	@commands.Cog.listener()
 	async def on_member_remove(self, member):
@@ -142,16 +225,12 @@ class Highlight(commands.Cog):
 	async def on_guild_leave(self, guild):
 		await self.db.clear_guild(guild.id)
 
-	def was_recently_active(self, info, *, delay=INACTIVITY_CUTOFF):
-		try:
-			return time.monotonic() - self.recently_active[info] < delay
-		except KeyError:
-			# if they haven't spoken at all, then they also haven't spoken recently
-			return False
+	def was_recently_active(self, info):
+		return info in self.recently_active
 
 	@commands.Cog.listener()
 	async def on_typing(self, channel, user, when):
-		self.bot.dispatch('user_activity', channel.id, user.id)
+		self.user_activity(channel.id, user.id)
 
 	# we use a class to have shared state which is isolated from the cog
 	# we use a nested class so as to have HighlightFinder defined close to where it's used
@@ -163,6 +242,8 @@ class Highlight(commands.Cog):
 			'author_id': 'ID of the user who sent the message',
 			'seen_users':
 				'users who have already been highlighted and should not be highlighted again for this message',
+			'is_command': 'whether the message invokes a command, or None if not checked yet',
+			'blocked_cache': 'user ID -> whether that user has blocked the author',
 		}
 
 		def __init__(self, *, bot, message, db):
@@ -170,42 +251,83 @@ class Highlight(commands.Cog):
 			self.db = db
 			self.message = message
 			self.author_id = self.message.author.id
-			self.seen_users = set()
+			self.is_command = None
+
+		async def find(self, on_found):
+			"""call on_found(member, preferred_caps) for each user to notify about the message, as soon as they are found"""
+			if self.message.author == self.bot.user:
+				# prevent someone adding "Your highlight words have been updated" as a highlight
+				return
 
-		async def __aiter__(self):
 			highlight_users, regex = await self.db.channel_highlights(self.message.channel)
 			if not highlight_users:
 				return
 
-			content = normalize_mentions(self.message.content)
+			# highlights are case insensitive, so match lowercase highlights against lowercase content
+			# rather than having the regex engine fold the case of every character it compares
+			content = normalize_mentions(self.message.content).lower()
 
+			matches = []
 			for highlight_match in regex.finditer(content):
-				start, end = highlight_match.span()
-				# peek around the matched string in order to distinguish textual numbers from @mentions
-				highlight = content[max(0, start - len('<@!')):end + len('>') + 1]
+				matched_users = highlight_users.get(highlight_match[0])
+				if matched_users:
+					matches.append((is_mention_match(content, *highlight_match.span()), matched_users))
 
-				for highlight_user in highlight_users.get(highlight_match[0].lower(), ()):
-					preferred_caps = highlight_user.preferred_caps
-					guild = self.message.guild
-					user = guild.get_member(highlight_user.id) or await guild.fetch_member(highlight_user.id)
-					if user and await self.should_notify(user, highlight, preferred_caps):
-						yield user, preferred_caps
+			if not matches:
+				return
+
+			# most messages match nothing, so only allocate the per-user state for those that do
+			self.seen_users = set()
+			self.blocked_cache = {}
 
-		async def should_notify(self, user, highlight, preferred_caps):
+			# resolve every matched user up front so that cache misses are fetched concurrently
+			members = await self.members({
+				highlight_user.id
+				for _, matched_users in matches
+				for highlight_user in matched_users
+			})
+
+			for is_mention, matched_users in matches:
+				for highlight_user in matched_users:
+					preferred_caps = highlight_user.preferred_caps
+					user = members.get(highlight_user.id)
+					if user and await self.should_notify(user, is_mention, preferred_caps):
+						on_found(user, preferred_caps)
+
+		async def members(self, user_ids):
+			"""return a mapping of user ID to member for each of user_ids who is in the message's guild"""
+			guild = self.message.guild
+			members = {}
+			missing = []
+			for user_id in user_ids:
+				member = guild.get_member(user_id)
+				if member is None:
+					missing.append(user_id)
+				else:
+					members[user_id] = member
+
+			fetched = await asyncio.gather(*map(guild.fetch_member, missing), return_exceptions=True)
+			for user_id, member in zip(missing, fetched):
+				if isinstance(member, discord.HTTPException):
+					# most likely they left the guild
+					continue
+				if isinstance(member, BaseException):
+					raise member
+				members[user_id] = member
+
+			return members
+
+		async def should_notify(self, user, is_mention, preferred_caps):
 			"""assuming that a highlight was found in the message, return whether to notify the user"""
-			if (await self.bot.get_context(self.message)).valid:
+			if await self.invokes_command():
 				# don't trigger on command invokes
 				# this prevents a sneaky user from adding "add" as a highlight and getting notified when someone
 				# adds a new highlight
 				return False
-			if self.message.author == self.bot.user:
-				# prevent someone adding "Your highlight words have been updated" as a highlight too
-				return False
 			if user == self.message.author:
 				# users may not highlight themselves
 				return False
-			# search is used on the highlight string because it may contain the preferred_caps as a substring
-			if bool(MENTION_RE.search(preferred_caps)) != bool(MENTION_RE.search(highlight)):
+			if contains_mention(preferred_caps) != is_mention:
 				# only highlight @mentions if the user requested that
 				return False
 			if await self.blocked(user):
@@ -217,19 +339,58 @@ class Highlight(commands.Cog):
 			self.seen_users.add(user)
 			return True
 
+		async def invokes_command(self):
+			# parsing the prefix is only needed once per message, and only once a highlight was found
+			if self.is_command is None:
+				self.is_command = (await self.bot.get_context(self.message)).valid
+			return self.is_command
+
 		async def blocked(self, user):
 			"""return whether this user (the highlightee) has blocked the highlighter"""
 			# we only have to check if the *user* is blocked here bc the database filters out blocked channels
-			return await self.db.blocked(user.id, self.author_id)
+			try:
+				return self.blocked_cache[user.id]
+			except KeyError:
+				# a user may be matched by several highlights in one message
+				blocked = self.blocked_cache[user.id] = await self.db.blocked(user.id, self.author_id)
+				return blocked
+
+	async def notify(self, recipients, message):
+		"""DM each (user, highlight) pair in recipients about being highlighted in message"""
+		# the message history is the same for everyone, so fetch it once, while their DM channels are opened
+		description, *channels = await asyncio.gather(
+			self.embed_description(message),
+			*(user.create_dm() for user, _ in recipients),
+			return_exceptions=True,
+		)
+		for result in description, *channels:
+			if isinstance(result, BaseException) and not isinstance(result, discord.HTTPException):
+				raise result
+		if isinstance(description, discord.HTTPException):
+			return
 
-	@classmethod
-	async def notify(cls, user, highlight, message):
-		message = await cls.notification_message(user, highlight, message)
-		with contextlib.suppress(discord.HTTPException):
-			await user.send(**message)
+		await asyncio.gather(*(
+			self.send_notification(channel, user, highlight, message, description)
+			for (user, highlight), channel in zip(recipients, channels)
+			if not isinstance(channel, discord.HTTPException)
+		))
 
-	@classmethod
-	async def notification_message(cls, user, highlight, message):
+	async def send_notification(self, channel, user, highlight, message, description):
+		try:
+			await channel.send(**self.notification_message(highlight, message, description))
+		except discord.Forbidden:
+			self.dm_closed[user.id] = time.monotonic()
+		except discord.HTTPException:
+			pass
+
+	def dms_closed(self, user, *, retry_after=DM_CLOSED_RETRY_AFTER):
+		try:
+			return time.monotonic() - self.dm_closed[user.id] < retry_after
+		except KeyError:
+			return False
+
+	@staticmethod
+	def notification_message(highlight, message, description):
 		"""Create an embed message to send to the user for being highlighted."""
 		content = (
 			f'In {message.channel.mention} for server {message.guild.name}, '
@@ -238,7 +399,7 @@ class Highlight(commands.Cog):
 		embed = discord.Embed()
 		embed.color = discord.Color.blurple()
 		embed.title = highlight
-		embed.description = await cls.embed_description(message)
+		embed.description = description
 		embed.set_author(name=message.author.name, icon_url=message.author.avatar.replace(format='png', size=64))
 
 		# "Triggered today at 21:21"
@@ -271,7 +432,7 @@ class Highlight(commands.Cog):
 	async def list(self, context):
 		"""Shows all your highlights words or phrases."""
 		if not context.interaction:
-			await context.message.delete(delay=DELETE_AFTER)
+			self.reaper.delete_later(context.message, DELETE_AFTER)
 
 		highlights = await self.db.user_highlights(context.guild.id, context.author.id)
 		if not highlights:
@@ -300,7 +461,7 @@ class Highlight(commands.Cog):
 		highlight word or phrases.
 		"""
 		if not context.interaction:
-			await context.message.delete(delay=DELETE_AFTER)
+			self.reaper.delete_later(context.message, DELETE_AFTER)
 		try:
 			await self.db.add(context.guild.id, context.author.id, normalize_mentions(highlight))
 		except commands.UserInputError:
@@ -317,7 +478,7 @@ class Highlight(commands.Cog):
 		so coffee, Coffee, and COFFEE will all notify you.
 		"""
 		if not context.interaction:
-			await context.message.delete(delay=DELETE_AFTER)
+			self.reaper.delete_later(context.message, DELETE_AFTER)
 		await self.db.remove(context.guild.id, context.author.id, highlight)
 		await delete_or_ephemeral(context, utils.SUCCESS_EMOJIS[True], delete_after=DELETE_AFTER)
 
@@ -325,7 +486,7 @@ class Highlight(commands.Cog):
 	async def blocked(self, context):
 		"""Shows you the users or channels that you have globally blocked."""
 		if not context.interaction:
-			await context.message.delete(delay=DELETE_AFTER)
+			self.reaper.delete_later(context.message, DELETE_AFTER)
 
 		embed = self.author_embed(context.author)
 		embed.title = 'Blocked'
@@ -362,7 +523,7 @@ class Highlight(commands.Cog):
 		which blocks them globally. This is not a per-server block.
 		"""
 		if not context.interaction:
-			await context.message.delete(delay=DELETE_AFTER)
+			self.reaper.delete_later(context.message, DELETE_AFTER)
 		entity_type = (
 			S.channel if isinstance(entity, (
 				discord.Thread,
@@ -389,7 +550,7 @@ class Highlight(commands.Cog):
 		This reverts a previous block action.
 		"""
 		if not context.interaction:
-			await context.message.delete(delay=DELETE_AFTER)
+			self.reaper.delete_later(context.message, DELETE_AFTER)
 		await self.db.unblock(context.guild.id, context.author.id, entity.id)
 		await delete_or_ephemeral(context, utils.SUCCESS_EMOJIS[True], delete_after=DELETE_AFTER)
 
@@ -397,7 +558,7 @@ class Highlight(commands.Cog):
 	async def blocked_by(self, context, *, user: User):
 		"""Tells you if a given user has blocked you."""
 		if not context.interaction:
-			await context.message.delete(delay=DELETE_AFTER)
+			self.reaper.delete_later(context.message, DELETE_AFTER)
 
 		if context.interaction:
 			clean_mention = user.mention
@@ -413,7 +574,7 @@ class Highlight(commands.Cog):
 	async def clear(self, context):
 		"""Removes all your highlight words or phrases."""
 		if not context.interaction:
-			await context.message.delete(delay=DELETE_AFTER)
+			self.reaper.delete_later(context.message, DELETE_AFTER)
 		await self.db.clear(context.guild.id, context.author.id)
 		await delete_or_ephemeral(context, utils.SUCCESS_EMOJIS[True], delete_after=DELETE_AFTER)
 
@@ -428,7 +589,7 @@ class Highlight(commands.Cog):
 		You can provide the server either by ID or by name. Names are case-sensitive.
 		"""
 		if not context.interaction:
-			await context.message.delete(delay=DELETE_AFTER)
+			self.reaper.delete_later(context.message, DELETE_AFTER)
 		try:
 			await self.db.import_(source_guild=server.id, target_guild=context.guild.id, user=context.author.id)
 		except commands.UserInputError:
@@ -13,9 +13,10 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import functools
+import importlib.metadata
 import inspect
 import os.path
-import pkg_resources
 
 import discord
 from discord.ext import commands
@@ -24,22 +25,45 @@ import pygit2
 from bot import BASE_DIR
 import utils
 
+INVITE_PERMISSIONS = discord.Permissions()
+# these are the same as the attributes of discord.Permissions
+INVITE_PERMISSIONS.update(**dict.fromkeys((
+	'read_messages',
+	'send_messages',
+	'read_message_history',
+	'external_emojis',
+	'add_reactions',
+	'manage_messages',
+	'embed_links'), True))
+
+# command callbacks don't change unless their extension is reloaded, so their source only needs to be read once
+
+@functools.lru_cache(maxsize=256)
+def _source_lines(func):
+	"""return the first line number of func's source and how many lines it spans"""
+	lines, firstlineno = inspect.getsourcelines(func)
+	return firstlineno, len(lines)
+
+@functools.lru_cache(maxsize=256)
+def _source_module(func):
+	"""return the name of the module func was defined in, and the path to its file"""
+	return inspect.getmodule(func).__name__, inspect.getfile(func)
+
+# commands defined in this package are linked to this repository
+OWN_PACKAGE = __name__.partition('.')[0]
+
+BACKSLASH_TO_SLASH = str.maketrans('\\', '/')
+
+@functools.lru_cache(maxsize=256)
+def _repo_location(filename):
+	"""return the path to filename relative to the repository, as used in URLs"""
+	return os.path.relpath(filename).translate(BACKSLASH_TO_SLASH)
+
 class Meta(commands.Cog):
 	@commands.hybrid_command(aliases=['inv'])
 	async def invite(self, context):
 		"""Gives you a link to add me to your server."""
-		# these are the same as the attributes of discord.Permissions
-		permission_names = (
-			'read_messages',
-			'send_messages',
-			'read_message_history',
-			'external_emojis',
-			'add_reactions',
-			'manage_messages',
-			'embed_links')
-		permissions = discord.Permissions()
-		permissions.update(**dict.fromkeys(permission_names, True))
-		await context.send('<%s>' % discord.utils.oauth_url(context.bot.user.id, permissions=permissions))
+		await context.send('<%s>' % discord.utils.oauth_url(context.bot.user.id, permissions=INVITE_PERMISSIONS))
 
 	@commands.hybrid_command()
 	async def support(self, context):
@@ -67,41 +91,43 @@ class Meta(commands.Cog):
 		# since we found the command we're looking for, presumably anyway, let's
 		# try to access the code itself
 		src = obj.callback
-		lines, firstlineno = inspect.getsourcelines(src)
-		module = inspect.getmodule(src).__name__
-		if module.startswith(self.__module__.split('.')[0]):
+		firstlineno, line_count = _source_lines(src)
+		module, filename = _source_module(src)
+		package = module.partition('.')[0]
+		if package == OWN_PACKAGE:
 			# not a built-in command
-			location = os.path.relpath(inspect.getfile(src)).replace('\\', '/')
+			location = _repo_location(filename)
 			at = self._current_revision()
 		else:
-			if module.startswith('discord'):
-				source_url = 'https://github.com/Rapptz/discord.py'
-				at = self._discord_revision()
-			if module.startswith('jishaku'):
-				source_url = 'https://github.com/Gorialis/jishaku'
-				at = self._pkg_version('jishaku')
-			elif module.startswith('bot_bin'):
-				source_url = 'https://github.com/ioistired/bot-bin'
-				at = self._bot_bin_revision()
+			try:
+				source_url, revision = self.library_sources[package]
+			except KeyError:
+				return await context.send('Could not find the source for that command.')
 
+			at = revision(type(self))
 			location = module.replace('.', '/') + '.py'
 
-		final_url = f'<{source_url}/blob/{at}/{location}#L{firstlineno}-L{firstlineno + len(lines) - 1}>'
+		final_url = f'<{source_url}/blob/{at}/{location}#L{firstlineno}-L{firstlineno + line_count - 1}>'
 		await context.send(final_url)
 
+	# these can't change while the bot is running, and are expensive to look up, so they are only looked up once
+
 	@staticmethod
+	@functools.cache
 	def _current_revision():
 		repo = pygit2.Repository(str(BASE_DIR / '.git'))
 		c = next(repo.walk(repo.head.target, pygit2.GIT_SORT_TOPOLOGICAL))
 		return c.short_id
 
 	@classmethod
+	@functools.cache
 	def _discord_revision(cls):
 		version = cls._pkg_version('discord.py')
 		version, sep, commit = version.partition('+g')
 		return commit or version
 
 	@classmethod
+	@functools.cache
 	def _bot_bin_revision(cls, *, default='master'):
 		ver = cls._pkg_version('bot_bin', default=default)
 		if ver == default:
@@ -110,12 +136,20 @@ class Meta(commands.Cog):
 		return 'v' + ver
 
 	@staticmethod
+	@functools.cache
 	def _pkg_version(pkg, *, default='master'):
 		try:
-			return pkg_resources.get_distribution(pkg).version
-		except pkg_resources.DistributionNotFound:
+			return importlib.metadata.version(pkg)
+		except importlib.metadata.PackageNotFoundError:
 			return default
 
+	# top level package -> (repository URL, function taking this class and returning the revision to link to)
+	library_sources = {
+		'discord': ('https://github.com/Rapptz/discord.py', lambda cls: cls._discord_revision()),
+		'jishaku': ('https://github.com/Gorialis/jishaku', lambda cls: cls._pkg_version('jishaku')),
+		'bot_bin': ('https://github.com/ioistired/bot-bin', lambda cls: cls._bot_bin_revision()),
+	}
+
 async def setup(bot):
 	await bot.add_cog(Meta())
 	if not bot.config.get('support_server_invite_code'):
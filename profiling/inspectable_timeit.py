@@ -1,5 +1,5 @@
 import timeit as _timeit
-import math
+import statistics
 import sys
 import warnings
 from dataclasses import dataclass, field
@@ -12,15 +12,16 @@ def timeit(stmt, *, setup='pass', repeat=5, number=0, precision=3, globals=None)
         number, _ = timer.autorange()
 
     all_runs = timer.repeat(repeat, number)
-    best = min(all_runs) / number
-    worst = max(all_runs) / number
+    per_loop = 1 / number
+    timings = [dt * per_loop for dt in all_runs]
+    best = min(timings)
+    worst = max(timings)
 
     if worst > 4 * best and best > 0 and worst > 1e-6:
         warnings.warn(ResultMayBeCached(best_time=best, worst_time=worst))
 
-    timings = [ dt / number for dt in all_runs]
-    average = math.fsum(timings) / len(timings)
-    stdev = math.sqrt(math.fsum((x - average) ** 2 for x in timings) / len(timings))
+    average = statistics.fmean(timings)
+    stdev = statistics.pstdev(timings, average)
 
     return TimeitResult(
         stmt=stmt,
@@ -81,8 +82,13 @@ def _format_time(timespan, *, precision=3):
     units = ['s', 'ms', 'us', 'ns']
     scaling = [1, 1e3, 1e6, 1e9]
 
-    if timespan > 0.0:
-        order = min(-int(math.floor(math.log10(timespan)) // 3), 3)
+    # index of the largest unit that the timespan is at least one of
+    if timespan >= 1:
+        order = 0
+    elif timespan >= 1e-3:
+        order = 1
+    elif timespan >= 1e-6:
+        order = 2
     else:
         order = 3
     return f"{timespan * scaling[order]:.{precision-1}f} {units[order]}"
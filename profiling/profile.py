@@ -21,22 +21,64 @@ normalize = partial(unicodedata.normalize, 'NFKC')
 with open(os.environ['dict']) as f:
 	words = [normalize(word.rstrip()) for word in f]
 
-lacbd_code = 'lacbd.Searcher([(word, None) for word in words])'
-regex_code = 're.compile(r"(?si)\b(?:{})\b".format("|".join(map(re.escape, words))))'
+def alternation(words):
+	# escape the whole dictionary with one re.escape() call, rather than one call per word.
+	# re.escape() leaves \x01 alone, and it doesn't occur in dictionaries
+	return re.escape('\x01'.join(words)).replace('\x01', '|')
 
-use_lacbd = os.environ.get('use_lacbd') == '1'
-print('Using', 'lacbd' if use_lacbd else 're')
+def make_automaton(words):
+	import ahocorasick
 
-print(timeit(lacbd_code if use_lacbd else regex_code, globals=globals()))
+	automaton = ahocorasick.Automaton()
+	for word in words:
+		automaton.add_word(word, word)
+	automaton.make_automaton()
+	return automaton
+
+def make_hyperscan_database(words):
+	import hyperscan
+
+	expressions = [rb'\b' + re.escape(word).encode() + rb'\b' for word in words]
+	database = hyperscan.Database()
+	database.compile(
+		expressions=expressions,
+		ids=list(range(len(expressions))),
+		flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH | hyperscan.HS_FLAG_UTF8] * len(expressions),
+	)
+	return database
+
+def hyperscan_search(database, text):
+	matches = []
+	database.scan(text.encode(), match_event_handler=lambda id, start, end, flags, context: matches.append(id))
+	return matches
+
+# backend: (instantiation code, search code)
+backends = {
+	'lacbd': (
+		'lacbd.Searcher([(word, None) for word in words])',
+		'searcher.search(normalize("cafécafé café café"))'),
+	're': (
+		're.compile(r"(?si)\b(?:{})\b".format(alternation(words)))',
+		'searcher.findall(normalize("cafécafé café café"))'),
+	# note that this does not check word boundaries, unlike the others
+	'ac': (
+		'make_automaton(words)',
+		'list(searcher.iter(normalize("cafécafé café café")))'),
+	'hyperscan': (
+		'make_hyperscan_database(words)',
+		'hyperscan_search(searcher, normalize("cafécafé café café"))'),
+}
+
+backend = os.environ.get('backend') or ('lacbd' if os.environ.get('use_lacbd') == '1' else 're')
+instantiation_code, search_code = backends[backend]
+print('Using', backend)
+
+print(timeit(instantiation_code, globals=globals()))
 
 print('After timing instantiation:', mem_usage())
 
-if use_lacbd:
-	searcher = eval(lacbd_code)
-	print(timeit('searcher.search(normalize("cafécafé café café"))', globals=globals()))
-else:
-	regex = eval(regex_code)
-	print(timeit('regex.findall(normalize("cafécafé café café"))', globals=globals()))
+searcher = eval(instantiation_code)
+print(timeit(search_code, globals=globals()))
 
 print('After timing searching:', mem_usage())
-print('Searcher object size:', humanize.naturalsize(sys.getsizeof(searcher if use_lacbd else regex)))
+print('Searcher object size:', humanize.naturalsize(sys.getsizeof(searcher)))
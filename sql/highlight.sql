@@ -13,6 +13,11 @@ WHERE
 	)
 -- :endmacro
 
+-- :macro highlighted_guilds()
+SELECT DISTINCT guild
+FROM highlights
+-- :endmacro
+
 -- :macro user_highlights()
 -- params: guild_id, user_id
 SELECT highlight
@@ -13,14 +13,22 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.	If not, see <https://www.gnu.org/licenses/>.
 
+import asyncio
 import collections
+import contextlib
 import functools
+import heapq
+import itertools
 import re
+import sys
+import time
 
+import discord
 import discord.utils
 from discord.ext import commands
 
-SUCCESS_EMOJIS = {False: '❌', True: '✅'}
+# indexed by whether the action succeeded: SUCCESS_EMOJIS[False] is the failure emoji
+SUCCESS_EMOJIS = ('❌', '✅')
 
 async def delete_or_ephemeral(ctx, /, content=None, **kwargs):
 	"""
@@ -37,48 +45,167 @@ async def delete_or_ephemeral(ctx, /, content=None, **kwargs):
 	else:
 		await ctx.send(content, **kwargs)
 
-class LRUDict(collections.OrderedDict):
+class LRUDict(dict):
 	"""a dictionary with fixed size, sorted by last use"""
 
+	# plain dicts keep insertion order, so reinserting a key marks it as most recently used
+	# and the first key is always the least recently used one
+
 	def __init__(self, size):
 		if size < 1:
 			raise ValueError('size must be ≥1')
 		super().__init__()
 		self.size = size
+		# when full, evict down to this many entries at once
+		self.low_water = size * 9 // 10
 
 	def __getitem__(self, key):
+		# a miss raises KeyError here, before anything needs to be moved
+		value = self.pop(key)
+		dict.__setitem__(self, key, value)
+		return value
+
+	def __setitem__(self, key, value):
+		if key in self:
+			dict.__delitem__(self, key)
+		elif len(self) >= self.size:
+			# evicted entries leave holes at the front of the table until it is resized,
+			# so finding the oldest key one at a time would walk over more of them on every insert
+			for old_key in list(itertools.islice(self, len(self) - self.low_water)):
+				dict.__delitem__(self, old_key)
+		dict.__setitem__(self, key, value)
+
+	def setdefault(self, key, default=None):
+		# dict.setdefault would bypass __setitem__ and never evict
 		try:
-			self.move_to_end(key)
+			return self[key]
 		except KeyError:
-			pass
-		return super().__getitem__(key)
+			self[key] = default
+			return default
+
+class TTLSet:
+	"""a set whose members expire ttl seconds after they were last added"""
+
+	def __init__(self, ttl):
+		self.ttl = int(ttl * 1e9)
+		# member -> time.monotonic_ns() at which it expires
+		self.expiries = {}
+		# (expiry, member) in the order they were added, which is also the order they expire
+		self.queue = collections.deque()
+
+	def add(self, key):
+		now = time.monotonic_ns()
+		expiry = now + self.ttl
+		self.expiries[key] = expiry
+		self.queue.append((expiry, key))
+		self._sweep(now)
+
+	def __contains__(self, key):
+		return self.expiries.get(key, 0) > time.monotonic_ns()
+
+	def __len__(self):
+		return len(self.expiries)
+
+	def _sweep(self, now):
+		queue = self.queue
+		expiries = self.expiries
+		while queue and queue[0][0] <= now:
+			expiry, key = queue.popleft()
+			# the key may have been added again since this entry was queued
+			if expiries.get(key) == expiry:
+				del expiries[key]
+
+class Reaper:
+	"""deletes messages after a delay using one long-lived task, rather than one task per message"""
+
+	def __init__(self):
+		# heap of (deadline, message ID, message)
+		self.queue = []
+		self.wakeup = asyncio.Event()
+		self.task = None
+		# deletions in progress, referenced so that they are not garbage collected before they finish
+		self.deletions = set()
+
+	def start(self):
+		self.task = asyncio.create_task(self.run())
+
+	async def stop(self):
+		if self.task is not None:
+			self.task.cancel()
+		# hand the pending messages off to discord.py's own delayed deletion, which does not depend on this task
+		now = time.monotonic()
+		while self.queue:
+			deadline, _, message = heapq.heappop(self.queue)
+			await message.delete(delay=max(deadline - now, 0))
+
+	def delete_later(self, message, delay):
+		# the message ID breaks ties between equal deadlines, as messages are not orderable
+		heapq.heappush(self.queue, (time.monotonic() + delay, message.id, message))
+		self.wakeup.set()
+
+	async def run(self):
+		while True:
+			if not self.queue:
+				await self.wakeup.wait()
+				self.wakeup.clear()
+				continue
+
+			timeout = self.queue[0][0] - time.monotonic()
+			if timeout > 0:
+				# sleep until the earliest deadline, or until a new message is queued, which may be due sooner
+				self.wakeup.clear()
+				with contextlib.suppress(asyncio.TimeoutError):
+					await asyncio.wait_for(self.wakeup.wait(), timeout)
+				continue
+
+			# each due message is deleted in a task of its own,
+			# so that a slow or failed deletion does not hold up the rest or end this loop
+			now = time.monotonic()
+			while self.queue and self.queue[0][0] <= now:
+				_, _, message = heapq.heappop(self.queue)
+				task = asyncio.create_task(self.delete(message))
+				self.deletions.add(task)
+				task.add_done_callback(self.deletions.discard)
 
-	def __setitem__(self, key, value):
-		super().__setitem__(key, value)
-		self.move_to_end(key)
-		if len(self) > self.size:
-			self.popitem(last=False)
+	@staticmethod
+	async def delete(message):
+		with contextlib.suppress(discord.HTTPException):
+			await message.delete()
 
 class Guild(commands.Converter):
-	@staticmethod
-	async def convert(context, argument):
+	# guild name -> guild ID, to avoid scanning every guild for names that are looked up repeatedly
+	name_cache = LRUDict(size=256)
+
+	@classmethod
+	async def convert(cls, context, argument):
+		# isascii() because isdigit() also accepts digits that int() does not, such as superscripts
+		if argument.isascii() and argument.isdigit():
+			guild = context.bot.get_guild(int(argument))
+			if guild:
+				return guild
+
 		try:
-			id = int(argument)
-		except ValueError:
+			guild = context.bot.get_guild(cls.name_cache[argument])
+		except KeyError:
 			pass
 		else:
-			guild = context.bot.get_guild(id)
-			if guild:
+			# the guild may have been left or renamed since
+			if guild and guild.name == argument:
 				return guild
 
 		guild = discord.utils.get(context.bot.guilds, name=argument)
 		if guild:
+			cls.name_cache[argument] = guild.id
 			return guild
 		raise commands.BadArgument('Server not found.')
 
 class _SymbolMeta(type):
 	def __getattr__(cls, key):
-		return cls(key)
+		self = cls(key)
+		if not key.startswith('__'):
+			# later lookups of this symbol will find the class attribute, without calling __getattr__
+			setattr(cls, key, self)
+		return self
 
 class Symbol(metaclass=_SymbolMeta):
 	"""Brings LISP style symbols to Python.
@@ -92,12 +219,13 @@ class Symbol(metaclass=_SymbolMeta):
 	_cache = {}
 
 	def __new__(cls, name: str):
-		try:
-			return cls._cache[name]
-		except KeyError:
+		self = cls._cache.get(name)
+		if self is None:
+			# interned keys let lookups with identifier-like literals, which are interned too, match by identity
+			name = sys.intern(name)
 			self = cls._cache[name] = super().__new__(cls)
 			self.name = name
-			return self
+		return self
 
 	def __hash__(self):
 		return id(self)